@@ -123,8 +123,11 @@ def write_json_file(path: str, content: dict) -> None:
     
 
 def get_har_metrics(har_file_name: str) -> dict:
+    return get_har_content_metrics(read_json_file(har_file_name), har_file_name)
+
+
+def get_har_content_metrics(har: dict, har_file_name: str) -> dict:
     domain_name = har_file_name.split('_')[0]
-    har_contents = read_json_file(har_file_name)['log']['entries']
-    result_dict = produce_json(har_contents, domain_name)
-    result_dict['load_time'] = read_json_file(har_file_name)['log']['pages'][0]['pageTimings']['onLoad']
+    result_dict = produce_json(har['log']['entries'], domain_name)
+    result_dict['load_time'] = har['log']['pages'][0]['pageTimings']['onLoad']
     return  result_dict # Domain name é o nome do site
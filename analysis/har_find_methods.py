@@ -3,19 +3,25 @@ a frequency table of HTTP methods (such as GET, POST, ..) for each crawl
 '''
 
 from har_analysis import load_har_file
+from request_log import load_request_log, request_log_to_entries
 
 def get_methods(in_har_name) -> dict:
     results = {}
-    har = load_har_file(in_har_name)
+    if in_har_name.endswith('.jsonl'):
+        entries = request_log_to_entries(load_request_log(in_har_name))
+    else:
+        entries = load_har_file(in_har_name)['log']['entries']
 
+    results['methods'] = count_methods(entries)
+    return results
+
+
+def count_methods(entries: list[dict]) -> dict:
     methods = {}
-    for entry in har['log']['entries']:
+    for entry in entries:
         method = entry['request']['method']
         if method not in methods:
             methods[method] = 1
         else:
             methods[method] += 1
-
-    results['methods'] = methods
-    return results
-
+    return methods
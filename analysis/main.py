@@ -37,6 +37,7 @@ of the redirection has different eTLD+1’s
 
 import os
 import json
+import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -44,6 +45,9 @@ import pandas as pd
 
 from har_analysis_vini import get_har_metrics
 from har_find_methods import get_methods
+from request_log import get_request_log_metrics
+from site_metrics import load_site_metrics
+from timing_attribution import compare_attributions, get_timing_attribution, load_tracker_categories
 
 
 def get_data(folder_name):
@@ -56,24 +60,35 @@ def get_data(folder_name):
         data["failures"] = analysis_data["cookies_not_found"]
         data["timeouts"] = analysis_data["timeouts"]
 
-    # get dicts from har files
+    # get dicts from har files, reusing the metrics of sites that were analyzed while crawling with --pipeline
+    site_metrics = load_site_metrics(folder_name)
     data["crawls"] = []
     for file_name in os.listdir(folder_name):
         if file_name.endswith('.har') and "investinholland.com_allow.har" != file_name:
             print(file_name)
+            if file_name in site_metrics:
+                data['crawls'].append(site_metrics[file_name])
+                continue
             har = f'{folder_name}/{file_name}' 
             data['crawls'].append(get_har_metrics(har))
             data['crawls'][-1]['har_file'] = file_name
 
+    # sites crawled with --live-capture whose HAR file was never written, e.g. because the crawler crashed
+    for file_name in os.listdir(folder_name):
+        if file_name.endswith('_requests.jsonl') and not os.path.exists(f'{folder_name}/{file_name[:-len("_requests.jsonl")]}.har'):
+            print(file_name)
+            data['crawls'].append(get_request_log_metrics(f'{folder_name}/{file_name}'))
+            data['crawls'][-1]['request_log_file'] = file_name
+
     return data
 
 
-def get_accept_data():
-    return get_data('crawl_data_allow')
+def get_accept_data(data_folder_prefix='crawl_data'):
+    return get_data(f'{data_folder_prefix}_allow')
 
 
-def get_blocked_data():
-    return get_data('crawl_data_block')
+def get_blocked_data(data_folder_prefix='crawl_data'):
+    return get_data(f'{data_folder_prefix}_block')
 
 
 def get_num_timeouts_failures(accept_data, reject_data):
@@ -111,7 +126,8 @@ def make_num_box_plots(accept_data, blocked_data):
         num_third_party_domains_same_site_none = []
 
         for crawl in crawl_data["crawls"]:
-            page_load_times.append(crawl['load_time'])
+            if crawl['load_time'] is not None:
+                page_load_times.append(crawl['load_time'])
             num_requests.append(crawl['num_reqs'])
             num_third_party_domains.append(len(crawl['third_party_domains']))
             num_tracker_domains.append(len(crawl['tracker_cookie_domains']))
@@ -207,11 +223,47 @@ def get_top_ten_third_party_domains(accept_data, blocked_data):
     df = df.drop('sum', axis=1)
     print(df.head(10))
 
+def get_crawl_timing_attribution(crawl, folder_name, tracker_categories):
+    # sites analyzed while crawling with --pipeline already have their timing attribution
+    if 'timing_attribution' in crawl:
+        return crawl['timing_attribution']
+    return get_timing_attribution(f'{folder_name}/{crawl["har_file"]}', tracker_categories)
+
+
+def get_tracker_load_time_attribution(accept_data, blocked_data, data_folder_prefix='crawl_data'):
+    # Time until onLoad attributed to trackers in the accept crawl, next to the time saved by blocking them
+
+    tracker_categories = load_tracker_categories()
+    blocked_crawls = {crawl['har_file'].replace('_block.har', ''): crawl for crawl in blocked_data['crawls'] if 'har_file' in crawl}
+
+    rows = []
+    for crawl in accept_data['crawls']:
+        site = crawl.get('har_file', '').replace('_allow.har', '')
+        if site not in blocked_crawls:
+            continue
+        savings = compare_attributions(
+            get_crawl_timing_attribution(crawl, f'{data_folder_prefix}_allow', tracker_categories),
+            get_crawl_timing_attribution(blocked_crawls[site], f'{data_folder_prefix}_block', tracker_categories)
+        )
+        # the site timed out in at least one of the crawls
+        if savings is None:
+            continue
+        rows.append({'Site': site, **savings})
+
+    df = pd.DataFrame(rows, columns=['Site', 'on_load_allow', 'on_load_block', 'saved_ms', 'tracker_share_ms'])
+    df = df.sort_values('tracker_share_ms', ascending=False)
+    print(df)
+    return df
+
+
 if __name__ == '__main__':
+    # python analysis/main.py [data_folder_prefix], e.g. crawl_data_replay to report on the replays
+    data_folder_prefix = sys.argv[1] if len(sys.argv) > 1 else 'crawl_data'
+
     # Load the data
     print("Loading data...")
-    accept_data = get_accept_data()
-    blocked_data = get_blocked_data()
+    accept_data = get_accept_data(data_folder_prefix)
+    blocked_data = get_blocked_data(data_folder_prefix)
 
     # 1. Table with number of timeouts and failures in the accept and on the block crawlers.
     print("Exercise 1...")
@@ -240,10 +292,13 @@ if __name__ == '__main__':
     for crawl_data, name, folder_name in zip(
         [accept_data, blocked_data],
         ["accept", "blocked"],
-        ["crawl_data_allow", "crawl_data_block"]
+        [f"{data_folder_prefix}_allow", f"{data_folder_prefix}_block"]
     ):
         for crawl in crawl_data["crawls"]:
-            method = get_methods(f'{folder_name}/{crawl["har_file"]}')
+            if 'methods' in crawl:
+                method = {'methods': crawl['methods']}
+            else:
+                method = get_methods(f'{folder_name}/{crawl.get("har_file", crawl.get("request_log_file"))}')
             for key in method['methods']:
                 if key not in methods[name]:
                     methods[name][key] = 0
@@ -256,9 +311,7 @@ if __name__ == '__main__':
     # (including first and third). In total, you should make 6 separate website lists: 2 crawls x 3
     # permissions
     print("Exercise 6...")
-    
-    
-
-
-
 
+    # Time until onLoad attributed to trackers, and how much blocking them saved
+    print("Tracker load time attribution...")
+    get_tracker_load_time_attribution(accept_data, blocked_data, data_folder_prefix)
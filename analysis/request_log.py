@@ -0,0 +1,69 @@
+'''
+Reads the JSON lines request logs written by the crawler with `--live-capture` and turns them into
+HAR-like entries, so the same metrics as for the HAR files can be computed while a crawl is still running
+or for a site whose HAR file was lost because the crawler crashed.
+'''
+
+import json
+import os
+
+from har_analysis_vini import produce_json
+
+
+def load_request_log(file_name: str) -> list[dict]:
+    records = []
+    with open(file_name, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the last line can be incomplete if the crawler was killed while writing it
+                continue
+    return records
+
+
+def request_log_to_entries(records: list[dict]) -> list[dict]:
+    """
+    Joins the request, response, requestfinished and requestfailed records of a log on their request id
+    and returns them as HAR-like entries, in the order in which the requests were made
+    """
+    entries = {}
+    for record in records:
+        if record.get('id') is None:
+            continue
+        if record['event'] == 'request':
+            entries[record['id']] = {
+                'startedTimestamp': record['ts'],
+                'request': {'method': record['method'], 'url': record['url'], 'headers': []},
+                'response': {'status': 0, 'headers': []},
+                'tracker': record['tracker'],
+                'blocked': record['blocked']
+            }
+        elif record['id'] in entries and record['event'] == 'response':
+            # headers are logged as the HAR list of name/value pairs, with one pair per set-cookie header
+            entries[record['id']]['request']['headers'] = record['request_headers']
+            entries[record['id']]['response'] = {'status': record['status'], 'headers': record['headers']}
+        elif record['id'] in entries and record['event'] == 'requestfinished':
+            entries[record['id']]['timing'] = record['timing']
+        elif record['id'] in entries and record['event'] == 'requestfailed':
+            entries[record['id']]['failure'] = record['failure']
+    return list(entries.values())
+
+
+def get_load_time(records: list[dict]) -> float | None:
+    """
+    Milliseconds from the first request until the first load event, which approximates `pageTimings.onLoad` of a HAR file
+    """
+    first_request = next((record['ts'] for record in records if record['event'] == 'request'), None)
+    load = next((record['ts'] for record in records if record['event'] == 'load'), None)
+    if first_request is None or load is None:
+        return None
+    return round((load - first_request) * 1000)
+
+
+def get_request_log_metrics(log_file_name: str) -> dict:
+    domain_name = os.path.basename(log_file_name).split('_')[0]
+    records = load_request_log(log_file_name)
+    result_dict = produce_json(request_log_to_entries(records), domain_name)
+    result_dict['load_time'] = get_load_time(records)
+    return result_dict
@@ -0,0 +1,63 @@
+'''
+Per-site metrics that are appended to a JSON lines file as soon as a site is crawled, so that the
+aggregate reports in main.py do not have to analyze every HAR file again
+'''
+
+import json
+import os
+from functools import lru_cache
+
+from har_analysis import load_har_file
+from har_analysis_vini import get_har_content_metrics
+from har_find_methods import count_methods
+from timing_attribution import attribute_page_load_time, load_tracker_categories
+
+
+SITE_METRICS_FILE = 'site_metrics.jsonl'
+
+
+@lru_cache(maxsize=1)
+def get_tracker_categories() -> dict[str, str]:
+    # loaded once per process instead of once per site
+    return load_tracker_categories()
+
+
+def analyze_site(har_path: str) -> dict:
+    # the HAR file is parsed once and shared by all the metrics
+    har = load_har_file(har_path)
+    metrics = get_har_content_metrics(har, har_path)
+    metrics['har_file'] = os.path.basename(har_path)
+    # the modification time tells whether the HAR file was crawled again after it was analyzed
+    metrics['har_mtime'] = os.path.getmtime(har_path)
+    metrics['methods'] = count_methods(har['log']['entries'])
+    metrics['timing_attribution'] = attribute_page_load_time(har, get_tracker_categories())
+    return metrics
+
+
+def append_site_metrics(file_name: str, metrics: dict) -> None:
+    with open(file_name, 'a') as f:
+        f.write(json.dumps(metrics) + '\n')
+
+
+def load_site_metrics(folder_name: str) -> dict:
+    """
+    Returns the metrics of every site in the folder that was not crawled again after it was analyzed, keyed by HAR file name
+    """
+    file_name = os.path.join(folder_name, SITE_METRICS_FILE)
+    if not os.path.exists(file_name):
+        return {}
+
+    site_metrics = {}
+    with open(file_name, 'r') as f:
+        for line in f:
+            try:
+                metrics = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # later lines are newer analyses of the same site
+            site_metrics[metrics['har_file']] = metrics
+
+    return {
+        har_file: metrics for har_file, metrics in site_metrics.items()
+        if os.path.exists(os.path.join(folder_name, har_file)) and os.path.getmtime(os.path.join(folder_name, har_file)) == metrics['har_mtime']
+    }
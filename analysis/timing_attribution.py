@@ -0,0 +1,252 @@
+'''
+Attributes the time until onLoad of every page in a HAR file to the parties whose requests were in flight.
+
+Every entry becomes an interval [startedDateTime, startedDateTime + time] relative to the start of its page,
+clipped to onLoad together with its timing phases. A single sweep over the sorted interval boundaries then gives, per group of requests
+(eTLD+1, entity or tracker category):
+    busy_ms: time during which at least one request of the group was in flight
+    exclusive_ms: time during which only requests of this group were in flight
+    share_ms: busy time split evenly between the groups in flight at the same moment, which sums to the
+        total time any request was in flight, so it can be compared between groups
+The sweep is O(n log n) in the number of entries of a page.
+'''
+
+import json
+from datetime import datetime
+from functools import lru_cache
+
+from tld import get_fld
+
+from har_analysis import get_entity_name, load_har_file, open_json_file
+
+
+FIRST_PARTY = '(first party)'
+NOT_A_TRACKER = '(not a tracker)'
+# in the order in which they happen. Playwright reports ssl separately from connect, so the phases add up to the entry time.
+TIMING_PHASES = ('blocked', 'dns', 'connect', 'ssl', 'send', 'wait', 'receive')
+
+
+def load_tracker_categories(file_name: str = 'tracker_domains.json') -> dict[str, str]:
+    """
+    Map every tracker domain in the Disconnect list to its category
+    :param file_name: Path to the Disconnect tracker list
+    :return: Dictionary from domain to category
+    """
+    with open(file_name, 'r') as f:
+        data = json.load(f)
+
+    tracker_categories = {}
+    for category in data['categories']:
+        for company in data['categories'][category]:
+            for domains in list(company.values())[0].values():
+                # some companies have non-list properties such as "performance": "true"
+                if isinstance(domains, list):
+                    for domain in domains:
+                        tracker_categories.setdefault(domain, category)
+    return tracker_categories
+
+
+@lru_cache(maxsize=1)
+def get_domain_map() -> dict:
+    # loaded on first use, so the sweep itself can be used without the domain map
+    return open_json_file('analysis/domain_map.json')
+
+
+def get_clipped_phases(timings: dict, entry_start: float, start: float, end: float) -> dict[str, float]:
+    """
+    Lay the timing phases of an entry out one after the other from the entry start, and keep only the part
+    of every phase that falls within the clipped interval [start, end]
+    :param timings: HAR timings of the entry
+    :param entry_start: Start of the entry before clipping
+    :param start: Start of the clipped interval
+    :param end: End of the clipped interval
+    :return: Dictionary from phase to its duration within the clipped interval
+    """
+    phases = {}
+    phase_start = entry_start
+    for phase in TIMING_PHASES:
+        duration = timings.get(phase, -1)
+        if duration <= 0:
+            continue
+        clipped_duration = min(phase_start + duration, end) - max(phase_start, start)
+        if clipped_duration > 0:
+            phases[phase] = clipped_duration
+        phase_start += duration
+    return phases
+
+
+def parse_har_datetime(value: str) -> float:
+    """
+    Convert a HAR ISO 8601 timestamp to milliseconds since the epoch
+    """
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000
+
+
+def get_entry_fld(entry: dict) -> str:
+    return get_fld(entry['request']['url'], fail_silently=True) or 'unknown'
+
+
+def get_page_intervals(page: dict, entries: list[dict], tracker_categories: dict[str, str]) -> list[dict]:
+    """
+    Build the interval index of a page: one interval per entry, relative to the start of the page and clipped to onLoad
+    :param page: HAR page
+    :param entries: HAR entries of the page, in the order in which they were recorded
+    :param tracker_categories: Dictionary from tracker domain to category
+    :return: List of intervals with their start, end, timing phases (clipped like the interval) and groups
+    """
+    page_start = parse_har_datetime(page['startedDateTime'])
+    on_load = page['pageTimings']['onLoad']
+    first_party_domain = get_entry_fld(entries[0]) if len(entries) > 0 else None
+
+    intervals = []
+    for entry in entries:
+        entry_start = parse_har_datetime(entry['startedDateTime']) - page_start
+        start, end = max(entry_start, 0), min(entry_start + max(entry.get('time', 0), 0), on_load)
+        if end <= start:
+            continue
+
+        domain = get_entry_fld(entry)
+        is_third_party = domain != first_party_domain
+        intervals.append({
+            'start': start,
+            'end': end,
+            'phases': get_clipped_phases(entry.get('timings', {}), entry_start, start, end),
+            'party': 'third' if is_third_party else 'first',
+            'domain': domain,
+            'entity': get_entity_name(domain, get_domain_map()) if is_third_party else FIRST_PARTY,
+            'category': tracker_categories.get(domain, NOT_A_TRACKER) if is_third_party else FIRST_PARTY
+        })
+    return intervals
+
+
+def attribute_intervals(intervals: list[dict], group_by: str) -> dict[str, dict]:
+    """
+    Sweep over the interval boundaries and compute busy, exclusive and share time per group
+    :param intervals: Intervals as returned by get_page_intervals
+    :param group_by: Interval key to group on, e.g. 'domain', 'entity', 'category' or 'party'
+    :return: Dictionary from group to its attributed times, number of requests and summed timing phases
+    """
+    groups = {}
+    events = []
+    for interval in intervals:
+        group = groups.setdefault(interval[group_by], {'requests': 0, 'busy_ms': 0.0, 'exclusive_ms': 0.0, 'share_ms': 0.0, 'phases': {}})
+        group['requests'] += 1
+        for phase, duration in interval['phases'].items():
+            group['phases'][phase] = group['phases'].get(phase, 0) + duration
+        # at equal times, ends (-1) are processed before starts (+1)
+        events.append((interval['start'], 1, interval[group_by]))
+        events.append((interval['end'], -1, interval[group_by]))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    in_flight = {}
+    active_groups = set()
+    active_since = {}
+    # integral of 1 / len(active_groups) over time, so the fair share of a group is the difference
+    # between its value when the group becomes inactive and when it became active
+    share_integral = 0.0
+    previous_time = None
+
+    for time, delta, group in events:
+        if previous_time is not None and len(active_groups) > 0:
+            elapsed = time - previous_time
+            share_integral += elapsed / len(active_groups)
+            if len(active_groups) == 1:
+                groups[next(iter(active_groups))]['exclusive_ms'] += elapsed
+        previous_time = time
+
+        if delta == 1:
+            if in_flight.get(group, 0) == 0:
+                active_groups.add(group)
+                active_since[group] = (time, share_integral)
+            in_flight[group] = in_flight.get(group, 0) + 1
+        else:
+            in_flight[group] -= 1
+            if in_flight[group] == 0:
+                active_groups.remove(group)
+                since_time, since_integral = active_since.pop(group)
+                groups[group]['busy_ms'] += time - since_time
+                groups[group]['share_ms'] += share_integral - since_integral
+
+    for group in groups.values():
+        for key in ('busy_ms', 'exclusive_ms', 'share_ms'):
+            group[key] = round(group[key], 3)
+    return groups
+
+
+def attribute_page_load_time(har: dict, tracker_categories: dict[str, str]) -> list[dict]:
+    """
+    Attribute the time until onLoad of every page in the HAR file
+    :param har: Dictionary with the content of the HAR file
+    :param tracker_categories: Dictionary from tracker domain to category
+    :return: One dictionary per page with the onLoad time and the attribution per party, eTLD+1, entity and tracker
+        category. Pages that never fired onLoad, e.g. because the site timed out, are left out.
+    """
+    pages = har['log'].get('pages', [])
+    if len(pages) == 0:
+        return []
+
+    entries_per_page = {page['id']: [] for page in pages}
+    for entry in har['log']['entries']:
+        # entries without a page reference are counted towards the first page
+        entries_per_page.get(entry.get('pageref'), entries_per_page[pages[0]['id']]).append(entry)
+
+    results = []
+    for page in pages:
+        on_load = page.get('pageTimings', {}).get('onLoad')
+        if on_load is None or on_load < 0:
+            continue
+        intervals = get_page_intervals(page, entries_per_page[page['id']], tracker_categories)
+        results.append({
+            'page': page['id'],
+            'on_load': on_load,
+            'parties': attribute_intervals(intervals, 'party'),
+            'domains': attribute_intervals(intervals, 'domain'),
+            'entities': attribute_intervals(intervals, 'entity'),
+            'categories': attribute_intervals(intervals, 'category')
+        })
+    return results
+
+
+def get_timing_attribution(in_har_name: str, tracker_categories: dict[str, str]) -> list[dict]:
+    return attribute_page_load_time(load_har_file(in_har_name), tracker_categories)
+
+
+def get_tracker_share(attribution: dict) -> float:
+    """
+    Time until onLoad attributed to trackers, i.e. the share of every tracker category of a page
+    """
+    return sum(group['share_ms'] for category, group in attribution['categories'].items() if category not in (FIRST_PARTY, NOT_A_TRACKER))
+
+
+def compare_attributions(allow_attributions: list[dict], block_attributions: list[dict]) -> dict | None:
+    """
+    Compare the load time of the first page of a site crawled with and without tracker blocking
+    :param allow_attributions: Page attributions of the crawl that allowed trackers
+    :param block_attributions: Page attributions of the crawl that blocked trackers
+    :return: Dictionary with the onLoad times of both crawls, the time saved and the time attributed to trackers in
+        the allow crawl, or None if the page did not load in one of the crawls
+    """
+    if len(allow_attributions) == 0 or len(block_attributions) == 0:
+        return None
+    allow_attribution = allow_attributions[0]
+    block_attribution = block_attributions[0]
+    return {
+        'on_load_allow': allow_attribution['on_load'],
+        'on_load_block': block_attribution['on_load'],
+        'saved_ms': allow_attribution['on_load'] - block_attribution['on_load'],
+        'tracker_share_ms': round(get_tracker_share(allow_attribution), 3)
+    }
+
+
+def get_blocking_savings(allow_har_name: str, block_har_name: str, tracker_categories: dict[str, str]) -> dict | None:
+    """
+    Compare the load time of a site crawled with and without tracker blocking
+    :param allow_har_name: HAR file of the crawl that allowed trackers
+    :param block_har_name: HAR file of the crawl that blocked trackers
+    :param tracker_categories: Dictionary from tracker domain to category
+    :return: See compare_attributions
+    """
+    return compare_attributions(
+        get_timing_attribution(allow_har_name, tracker_categories),
+        get_timing_attribution(block_har_name, tracker_categories)
+    )
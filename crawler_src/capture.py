@@ -0,0 +1,98 @@
+import json
+from time import time
+
+from playwright.sync_api import Error as PlaywrightError, Page, Request, Response
+from tld import get_fld
+
+
+class RequestLog:
+    """
+    Streams the network events of a page visit to an append-only JSON lines file while the visit is
+    still running, so that the data of a site survives a crash or a timeout and does not have to be
+    buffered until Playwright flushes the HAR file at `context.close()`.
+    """
+
+    def __init__(self, path: str, tracker_domains: set[str], block_trackers: bool) -> None:
+        self.path = path
+        self.tracker_domains = tracker_domains
+        self.block_trackers = block_trackers
+        self._request_ids = {}
+        self._next_request_id = 0
+        # line buffered, so every record is on disk as soon as it is written. The file is truncated,
+        # since request ids start at 0 on every visit and records of an earlier visit would be joined with this one
+        self._file = open(path, 'w', buffering=1)
+
+    def attach(self, page: Page) -> None:
+        page.on('request', self._on_request)
+        page.on('response', self._on_response)
+        page.on('requestfinished', self._on_request_finished)
+        page.on('requestfailed', self._on_request_failed)
+        page.on('domcontentloaded', lambda _: self._write({'event': 'domcontentloaded', 'ts': time()}))
+        page.on('load', lambda _: self._write({'event': 'load', 'ts': time()}))
+
+    def close(self) -> None:
+        self._request_ids.clear()
+        self._file.close()
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def _is_tracker(self, url: str) -> bool:
+        return get_fld(url, fail_silently=True) in self.tracker_domains
+
+    def _on_request(self, request: Request) -> None:
+        request_id = self._next_request_id
+        self._next_request_id += 1
+        self._request_ids[request] = request_id
+
+        is_tracker = self._is_tracker(request.url)
+        self._write({
+            'event': 'request',
+            'ts': time(),
+            'id': request_id,
+            'url': request.url,
+            'method': request.method,
+            'resource_type': request.resource_type,
+            'tracker': is_tracker,
+            'blocked': self.block_trackers and is_tracker
+        })
+
+    def _on_response(self, response: Response) -> None:
+        request = response.request
+        # `headers` leaves out security-related headers such as cookie and set-cookie, so the raw headers
+        # are logged instead. The raw request headers are only known once the response has arrived.
+        try:
+            request_headers, response_headers = request.headers_array(), response.headers_array()
+        except PlaywrightError:
+            # the page was closed before the raw headers could be fetched
+            request_headers, response_headers = [], []
+        self._write({
+            'event': 'response',
+            'ts': time(),
+            'id': self._request_ids.get(request),
+            'url': response.url,
+            'status': response.status,
+            'request_headers': request_headers,
+            'headers': response_headers
+        })
+
+    def _on_request_finished(self, request: Request) -> None:
+        # responseEnd of the timing is only set once the body has been received
+        self._write({
+            'event': 'requestfinished',
+            'ts': time(),
+            'id': self._request_ids.pop(request, None),
+            'timing': request.timing
+        })
+
+    def _on_request_failed(self, request: Request) -> None:
+        is_tracker = self._is_tracker(request.url)
+        self._write({
+            'event': 'requestfailed',
+            'ts': time(),
+            'id': self._request_ids.pop(request, None),
+            'url': request.url,
+            'failure': request.failure,
+            'tracker': is_tracker,
+            'blocked': self.block_trackers and is_tracker
+        })
@@ -1,53 +1,149 @@
-import os, re, sys
-import numpy as np
-from playwright.sync_api import sync_playwright, Playwright, Page, TimeoutError as PlaywrightTimeoutError, Request, Route
+import os, re, socket, subprocess, sys
+from playwright.sync_api import sync_playwright, Playwright, Browser, Page, TimeoutError as PlaywrightTimeoutError, Request, Route
 from time import sleep
 from tld import get_fld
 import json
 
+from capture import RequestLog
+from job_queue import JobQueue, Heartbeat
+from pipeline import AnalysisPipeline
+from scroll import scroll_page
+
+
+QUEUE_POLL_SECONDS = 10
+
 
 def main(playwright: Playwright, options: dict) -> None:
     suffix = '_block' if options['block_trackers'] else '_allow'
-    crawl_data_dir = 'crawl_data'+suffix
+    # replayed crawls are kept apart from the live crawls they are replayed from
+    data_folder_prefix = 'crawl_data_replay' if options['replay'] else 'crawl_data'
+    crawl_data_dir = data_folder_prefix+suffix
+    os.makedirs(crawl_data_dir, exist_ok=True)
 
     chromium = playwright.chromium # or "firefox" or "webkit".
-    browser = chromium.launch(headless=False)
+    # nothing is fetched from the network when replaying, so there is no need to look like a real user
+    browser = chromium.launch(headless=options['replay'])
 
     accept_phrases = read_file('accept_words.txt')
+    blocked_trackers = get_blocked_trackers()
+
+    # with --pipeline, every crawled site is analyzed in the background while the crawler continues
+    pipeline = AnalysisPipeline(crawl_data_dir) if options['pipeline'] else None
+
+    if options['queue'] is None:
+        results = {}
+        for url in options['urls']:
+            results[url] = crawl_site(browser, url, options, crawl_data_dir, accept_phrases, blocked_trackers)
+            submit_to_pipeline(pipeline, crawl_data_dir, results[url])
+    else:
+        # only one of the workers sharing the queue gets the results, the others leave the report to it
+        results = crawl_from_queue(browser, options, crawl_data_dir, accept_phrases, blocked_trackers, pipeline)
+
+    browser.close()
+
+    if pipeline is not None:
+        pipeline.close()
+
+    if results is None:
+        return
+
+    write_analysis(crawl_data_dir, results)
+
+    if pipeline is not None:
+        refresh_reports(data_folder_prefix)
+
+
+def crawl_from_queue(browser: Browser, options: dict, crawl_data_dir: str, accept_phrases: list[str], blocked_trackers: set[str], pipeline: AnalysisPipeline | None) -> dict | None:
+    """
+    Pulls sites from the shared job queue until it is drained. Returns the results of all workers if this
+    worker is the one that should write the report, and None otherwise.
+    """
+    mode = ('replay_' if options['replay'] else '')+('block' if options['block_trackers'] else 'allow')
+    queue = JobQueue(options['queue'], mode=mode)
+    queue.add(options['urls'])
+    worker = f'{socket.gethostname()}-{os.getpid()}'
+
+    while True:
+        url = queue.lease(worker)
+        if url is None:
+            if queue.is_drained():
+                break
+            # other workers still hold leases, which are handed out again if one of those workers crashed
+            sleep(QUEUE_POLL_SECONDS)
+            continue
+
+        heartbeat = Heartbeat(queue, url, worker)
+        heartbeat.start()
+        try:
+            result = crawl_site(browser, url, options, crawl_data_dir, accept_phrases, blocked_trackers)
+        except Exception as e:
+            print(f'Failed to crawl {url}: {e}')
+            queue.fail(url, worker, repr(e))
+        else:
+            if result is None:
+                queue.fail(url, worker, 'no recorded HAR to replay')
+            else:
+                if queue.complete(url, worker, result):
+                    submit_to_pipeline(pipeline, crawl_data_dir, result)
+                else:
+                    # the lease expired and the site may already be crawled again by another worker, which owns its files now
+                    print(f'Lost the lease on {url}, dropping its result')
+        finally:
+            heartbeat.stop()
+
+    print(f'Queue drained: {queue.counts()}')
+    results = None
+    if queue.claim_report(worker):
+        results = queue.results()
+        # sites that ran out of attempts have no result, but still have to show up in the analysis
+        results.update({url: None for url in queue.failed()})
+    queue.close()
+    return results
 
-    # code for analysis
-    cookies_not_found = 0
-    timeouts = 0
 
-    for url in options['urls']:
-        print(f'Processing {url}')
-        fld = get_fld(url)
-        file_prefix = fld+suffix
+def crawl_site(browser: Browser, url: str, options: dict, crawl_data_dir: str, accept_phrases: list[str], blocked_trackers: set[str]) -> dict | None:
+    suffix = '_block' if options['block_trackers'] else '_allow'
+    print(f'Processing {url}')
+    fld = get_fld(url)
+    file_prefix = fld+suffix
+
+    replay_har_path = os.path.join('crawl_data_allow', fld+'_allow.har')
+    if options['replay'] and not os.path.exists(replay_har_path):
+        print(f'No recorded HAR to replay for {url}')
+        return None
 
-        context = browser.new_context(
-            record_har_path=os.path.join(crawl_data_dir,file_prefix+'.har'),
-            record_video_dir=crawl_data_dir
-        )
+    context = browser.new_context(
+        record_har_path=os.path.join(crawl_data_dir,file_prefix+'.har'),
+        record_video_dir=None if options['replay'] else crawl_data_dir
+    )
+    request_log = None
+    try:
+        if options['replay']:
+            # serve every request from the HAR recorded by the allow crawl, requests that are not in it fail
+            context.route_from_har(replay_har_path, not_found='abort')
         page = context.new_page()
 
+        if options['live_capture']:
+            request_log = RequestLog(os.path.join(crawl_data_dir,file_prefix+'_requests.jsonl'), blocked_trackers, options['block_trackers'])
+            request_log.attach(page)
+
         if options['block_trackers']:
-            page.route('**', lambda route, request: block_tracking_domains(route, request, get_blocked_trackers()))
+            page.route('**', lambda route, request: block_tracking_domains(route, request, blocked_trackers))
 
         # set timeout to load the page to 30 seconds
         page.set_default_timeout(30000)
+        # when replaying, the page is scrolled in fixed steps, so every replay of a site makes the same requests
+        scroll_options = {'stepJitterPx': 0, 'minPauseMs': 500, 'maxPauseMs': 500} if options['replay'] else {}
         try:
             page.goto(url)
         except PlaywrightTimeoutError:
             print(f'Timeout error: {url}')
-            timeouts += 1
-            page.close()
-            context.close()
-            continue
-        
-        sleep(10)
+            return {'site': fld, 'har_file': file_prefix+'.har', 'timeout': True}
+
+        wait(page, 10, options)
         # screenshot before accepting cookies
         page.screenshot(path=os.path.join(crawl_data_dir,file_prefix+'_pre_consent.png'))
-        
+
         # Accept cookies
         cookie_found = False
         for phrase in accept_phrases:
@@ -62,26 +158,75 @@ def main(playwright: Playwright, options: dict) -> None:
                     break
                 except:
                     continue
-        if not cookie_found:
-            cookies_not_found += 1   
         print(f"cookie consent clicked: {cookie_found}")
-        sleep(3)
+        wait(page, 3, options)
         # reload fonts
         # page.reload()
         # sleep(3)
         # screenshot after accepting cookies
         page.screenshot(path=os.path.join(crawl_data_dir,file_prefix+'_post_consent.png'))
-        scroll_in_multiple_steps(page)
-        sleep(3)
+        scroll_report = scroll_page(page, **scroll_options)
+        print(f"scrolled {scroll_report['steps']} steps, stopped at: {scroll_report['stop_reason']}")
+        wait(page, 3, options)
         page.close()
-        # Playwright does not allow you to specify the name of the video, so we have to manually rename it
-        rename_video(page.video.path(), file_prefix+'.webm')
+        if page.video is not None:
+            # Playwright does not allow you to specify the name of the video, so we have to manually rename it
+            rename_video(page.video.path(), file_prefix+'.webm')
+
+        return {'site': fld, 'har_file': file_prefix+'.har', 'timeout': False, 'cookie_found': cookie_found, 'scroll_report': scroll_report}
+    finally:
+        # also when the visit fails, so a failed attempt does not leave its HAR recording and request log open
         context.close()
-        
-    browser.close()
+        if request_log is not None:
+            request_log.close()
+
+
+def submit_to_pipeline(pipeline: AnalysisPipeline | None, crawl_data_dir: str, result: dict | None) -> None:
+    # the HAR file is only complete once the context is closed, which crawl_site does before returning
+    if pipeline is not None and result is not None:
+        pipeline.submit(os.path.join(crawl_data_dir, result['har_file']))
+
+
+def refresh_reports(data_folder_prefix: str) -> None:
+    """
+    Runs the aggregate analysis once both the allow and the block crawl with the given data folder prefix
+    (live crawls or replays) are done. The sites analyzed by the pipeline are read from site_metrics.jsonl,
+    so this only takes a fraction of a full analysis run.
+    """
+    if not all(os.path.exists(os.path.join(data_folder_prefix+suffix, 'analysis.json')) for suffix in ('_allow', '_block')):
+        print('Skipping the reports until both the allow and the block crawl are done')
+        return
+    subprocess.run([sys.executable, os.path.join('analysis', 'main.py'), data_folder_prefix])
+
+
+def wait(page: Page, seconds: float, options: dict) -> None:
+    """
+    Gives the page time to settle. Waiting for the network to be idle does not work for a replayed page, since
+    the HAR answers every request at once, so the replay waits just as long as the live crawl, for the timers
+    and lazy loads of the page to run. wait_for_timeout keeps handling the events of the page while waiting.
+    """
+    if not options['replay']:
+        sleep(seconds)
+        return
+    page.wait_for_timeout(seconds*1000)
+
+
+def write_analysis(crawl_data_dir: str, results: dict) -> None:
+    # sites without a result could not be crawled at all, e.g. because they ran out of attempts in the queue
+    crawl_error_sites = [url for url, result in results.items() if result is None]
+    results = {url: result for url, result in results.items() if result is not None}
+    cookies_not_found = len([result for result in results.values() if not result['timeout'] and not result['cookie_found']])
+    timeouts = len([result for result in results.values() if result['timeout']])
+    scroll_reports = {result['site']: result['scroll_report'] for result in results.values() if not result['timeout']}
 
     with open(os.path.join(crawl_data_dir,'analysis.json'), 'w') as f:
-        f.write(f'{{"cookies_not_found": {cookies_not_found}, "timeouts": {timeouts}}}')
+        json.dump({
+            'cookies_not_found': cookies_not_found,
+            'timeouts': timeouts,
+            'crawl_errors': len(crawl_error_sites),
+            'crawl_error_sites': crawl_error_sites,
+            'scroll_reports': scroll_reports
+        }, f)
 
 def get_blocked_trackers():
     # Read the JSON file
@@ -101,21 +246,8 @@ def get_blocked_trackers():
 
 
 def block_tracking_domains(route: Route, request: Request, blocked_urls: list[str]) -> None:
-    route.abort() if get_fld(request.url) in blocked_urls else route.continue_()
-
-
-def scroll_in_multiple_steps(page: Page):
-    at_bottom = False
-    current_y_position = page.evaluate('window.scrollY')
-    previous_y_position = current_y_position
-    while not at_bottom:
-        # Using a trackpad, a single swipe scrolls about 1200 pixels
-        scroll_by = 1200 + np.random.randint(low=-100, high=100)
-        page.evaluate(f'window.scrollBy(0,{scroll_by})')
-        sleep(0.5+np.random.rand())
-        current_y_position = page.evaluate('window.scrollY')
-        at_bottom = current_y_position == previous_y_position
-        previous_y_position = current_y_position
+    # fallback instead of continue_, so that requests that are not blocked can still be served by a HAR being replayed
+    route.abort() if get_fld(request.url, fail_silently=True) in blocked_urls else route.fallback()
 
 
 def rename_video(path_to_video: str, new_name: str) -> None:
@@ -134,13 +266,20 @@ def read_file(file_path: str) -> list[str]:
 
 
 def parse_command_line_args(args: list[str]) -> dict:
-    if len(args) < 3 or len(args) > 4: raise AssertionError('too many or too little arguments given')
+    num_optional_flags = len([flag for flag in ('--block-trackers', '--live-capture', '--replay', '--pipeline') if flag in args])
+    num_options = len([option for option in ('-u', '-l', '-q') if option in args])
+    if len(args) - num_optional_flags - 2*num_options != 1 or num_options > 2: raise AssertionError('too many or too little arguments given')
     if '-u' in args and '-l' in args: raise AssertionError('cannot provide -u and -l at the same time')
-    if not '-u' in args and not '-l' in args: raise AssertionError('expected one of [-u <example.com> | -l <sites-list.txt>], but none were given')
+    if not '-u' in args and not '-l' in args and not '-q' in args: raise AssertionError('expected one of [-u <example.com> | -l <sites-list.txt> | -q <queue.db>], but none were given')
 
     parsed_args = {}
     parsed_args['block_trackers'] = '--block-trackers' in sys.argv
-    parsed_args['urls'] = [args[args.index('-u')+1]] if '-u' in args else read_file(args[args.index('-l')+1])
+    parsed_args['live_capture'] = '--live-capture' in sys.argv
+    parsed_args['replay'] = '--replay' in sys.argv
+    parsed_args['pipeline'] = '--pipeline' in sys.argv
+    # with -q, the sites given with -u or -l are added to the queue and the process works on the queue
+    parsed_args['queue'] = args[args.index('-q')+1] if '-q' in args else None
+    parsed_args['urls'] = [args[args.index('-u')+1]] if '-u' in args else read_file(args[args.index('-l')+1]) if '-l' in args else []
     return parsed_args
 
     
@@ -0,0 +1,206 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from time import time
+
+
+class JobQueue:
+    """
+    A crawl queue stored in a SQLite file, so that several crawler processes on one or more machines
+    sharing a filesystem can pull sites from the same list. A worker leases a site for `lease_seconds`
+    and has to renew the lease with `heartbeat` while it is crawling; sites whose lease expired (e.g.
+    because the worker crashed) are handed out again until they have been attempted `max_attempts` times.
+
+    A queue belongs to a single crawl mode (e.g. allow or block), which is stored in the queue when it is
+    created, so that the results of one crawl are never reused for another.
+
+    The default rollback journal is used on purpose, since SQLite's WAL mode does not work on network filesystems.
+    """
+
+    def __init__(self, path: str, mode: str | None = None, lease_seconds: float = 300, max_attempts: int = 3) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # autocommit mode, transactions are started explicitly with BEGIN IMMEDIATE where needed
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                url TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT
+            )
+        ''')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        if mode is not None:
+            self._check_mode(mode)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def add(self, urls: list[str]) -> int:
+        """
+        Adds the urls to the queue, skipping the ones already in it, and returns the number of urls added
+        """
+        with self._transaction():
+            offset = self._connection.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+            cursor = self._connection.executemany(
+                'INSERT OR IGNORE INTO jobs (url, position) VALUES (?, ?)',
+                [(url, offset+i) for i, url in enumerate(urls)]
+            )
+            if cursor.rowcount > 0:
+                # the queue is no longer drained, so the report has to be written again
+                self._connection.execute("DELETE FROM meta WHERE key = 'reported_by'")
+            return cursor.rowcount
+
+    def lease(self, worker: str) -> str | None:
+        """
+        Leases the next pending site to the worker and returns its url, or None if no site is pending
+        """
+        with self._transaction():
+            self._requeue_expired()
+            row = self._connection.execute(
+                "SELECT url FROM jobs WHERE status = 'pending' ORDER BY position LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, worker = ?, lease_expires = ? WHERE url = ?",
+                (worker, time() + self.lease_seconds, row[0])
+            )
+            return row[0]
+
+    def heartbeat(self, url: str, worker: str) -> bool:
+        """
+        Extends the lease of the worker on the site, returns False if the worker no longer holds the lease
+        """
+        cursor = self._connection.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE url = ? AND worker = ? AND status = 'leased'",
+            (time() + self.lease_seconds, url, worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, url: str, worker: str, result: dict) -> bool:
+        cursor = self._connection.execute(
+            "UPDATE jobs SET status = 'done', lease_expires = NULL, result = ? WHERE url = ? AND worker = ? AND status = 'leased'",
+            (json.dumps(result), url, worker)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, url: str, worker: str, error: str) -> bool:
+        """
+        Reports a failed attempt, the site is queued again unless it ran out of attempts
+        """
+        cursor = self._connection.execute(
+            '''UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                   worker = NULL, lease_expires = NULL, error = ?
+               WHERE url = ? AND worker = ? AND status = 'leased'
+            ''',
+            (self.max_attempts, error, url, worker)
+        )
+        return cursor.rowcount == 1
+
+    def requeue_expired(self) -> int:
+        with self._transaction():
+            return self._requeue_expired()
+
+    def is_drained(self) -> bool:
+        """
+        Whether no site is pending or leased anymore. Leased sites can still be queued again if their lease expires.
+        """
+        with self._transaction():
+            self._requeue_expired()
+            return self._is_drained()
+
+    def claim_report(self, worker: str) -> bool:
+        """
+        Returns True for exactly one worker once the queue is drained, which is the worker that should write the report
+        """
+        with self._transaction():
+            if not self._is_drained():
+                return False
+            cursor = self._connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('reported_by', ?)", (worker,))
+            return cursor.rowcount == 1
+
+    def counts(self) -> dict:
+        return dict(self._connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def results(self) -> dict:
+        """
+        Returns the results reported by the workers, keyed by url
+        """
+        rows = self._connection.execute("SELECT url, result FROM jobs WHERE status = 'done' ORDER BY position").fetchall()
+        return {url: json.loads(result) for url, result in rows}
+
+    def failed(self) -> list[str]:
+        """
+        Returns the urls of the sites that ran out of attempts
+        """
+        rows = self._connection.execute("SELECT url FROM jobs WHERE status = 'failed' ORDER BY position").fetchall()
+        return [row[0] for row in rows]
+
+    def _is_drained(self) -> bool:
+        row = self._connection.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()
+        return row[0] == 0
+
+    def _check_mode(self, mode: str) -> None:
+        with self._transaction():
+            self._connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('mode', ?)", (mode,))
+            queue_mode = self._connection.execute("SELECT value FROM meta WHERE key = 'mode'").fetchone()[0]
+        if queue_mode != mode:
+            raise ValueError(f'queue {self.path} belongs to a {queue_mode} crawl, cannot use it for a {mode} crawl')
+
+    def _requeue_expired(self) -> int:
+        cursor = self._connection.execute(
+            '''UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                   worker = NULL, lease_expires = NULL, error = 'lease expired'
+               WHERE status = 'leased' AND lease_expires < ?''',
+            (self.max_attempts, time())
+        )
+        return cursor.rowcount
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never lease the same site
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+
+class Heartbeat(threading.Thread):
+    """
+    Renews the lease on a site in the background while the crawler is busy with it. The thread uses its
+    own connection, since SQLite connections cannot be shared between threads.
+    """
+
+    def __init__(self, queue: JobQueue, url: str, worker: str) -> None:
+        super().__init__(daemon=True)
+        self.queue_path = queue.path
+        self.lease_seconds = queue.lease_seconds
+        self.url = url
+        self.worker = worker
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        queue = JobQueue(self.queue_path, lease_seconds=self.lease_seconds)
+        try:
+            while not self._stopped.wait(self.lease_seconds / 3):
+                if not queue.heartbeat(self.url, self.worker):
+                    print(f'Lost the lease on {self.url}')
+                    break
+        finally:
+            queue.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
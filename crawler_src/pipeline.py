@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import queue
+import sys
+
+
+ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis')
+# the analysis modules import each other as top-level modules, like when main.py is run as a script
+if ANALYSIS_DIR not in sys.path:
+    sys.path.insert(0, ANALYSIS_DIR)
+# how long to wait for room in the queue before checking again whether the workers are still alive
+PUT_TIMEOUT_SECONDS = 5
+
+
+class AnalysisPipeline:
+    """
+    Analyzes the HAR files of crawled sites in a pool of worker processes while the crawler moves on to the
+    next site. The queue between the crawler and the workers is bounded, so when the analysis falls behind
+    `submit` blocks the crawler instead of letting unprocessed sites pile up in memory.
+    The metrics of every site are appended to `site_metrics.jsonl` in the crawl data directory.
+    If every worker has died, e.g. because it was killed for running out of memory, the crawler analyzes
+    the sites itself instead of waiting forever for room in the queue.
+    The workers are spawned rather than forked, since the crawler already runs Playwright's threads and
+    connection when the pipeline is created, and a forked child would inherit them in whatever state they were in.
+    """
+
+    def __init__(self, crawl_data_dir: str, num_workers: int = 2, max_pending: int = 4) -> None:
+        self.crawl_data_dir = crawl_data_dir
+        context = multiprocessing.get_context('spawn')
+        self._queue = context.Queue(maxsize=max_pending)
+        # appends of long lines are not atomic, so the workers take turns writing
+        self._write_lock = context.Lock()
+        self._workers = [
+            context.Process(target=analysis_worker, args=(self._queue, self._write_lock, crawl_data_dir), daemon=True)
+            for _ in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, har_path: str) -> None:
+        while self._has_live_workers():
+            try:
+                self._queue.put(har_path, timeout=PUT_TIMEOUT_SECONDS)
+                return
+            except queue.Full:
+                continue
+        # sites that were still queued when the last worker died are analyzed by main.py instead
+        print(f'No analysis workers left, analyzing {har_path} in the crawler')
+        analyze_and_append(har_path, self._write_lock, self.crawl_data_dir)
+
+    def close(self) -> None:
+        """
+        Waits until every submitted site has been analyzed and stops the workers
+        """
+        # one stop signal per worker, unless the workers died before they could all be sent
+        num_stop_signals = 0
+        while num_stop_signals < len(self._workers) and self._has_live_workers():
+            try:
+                self._queue.put(None, timeout=PUT_TIMEOUT_SECONDS)
+                num_stop_signals += 1
+            except queue.Full:
+                continue
+        for worker in self._workers:
+            worker.join()
+        # whatever is left in the queue will never be read, so do not wait for it to be flushed at exit
+        self._queue.cancel_join_thread()
+
+    def _has_live_workers(self) -> bool:
+        return any(worker.is_alive() for worker in self._workers)
+
+
+def analyze_and_append(har_path: str, write_lock, crawl_data_dir: str) -> None:
+    try:
+        # imported here, since importing the analysis modules can fail, e.g. when analysis/domain_map.json is missing
+        from site_metrics import SITE_METRICS_FILE, analyze_site, append_site_metrics
+        metrics = analyze_site(har_path)
+    except Exception as e:
+        print(f'Failed to analyze {har_path}: {e!r}')
+        return
+    with write_lock:
+        append_site_metrics(os.path.join(crawl_data_dir, SITE_METRICS_FILE), metrics)
+    print(f'Analyzed {har_path}')
+
+
+def analysis_worker(har_queue: multiprocessing.Queue, write_lock, crawl_data_dir: str) -> None:
+    while (har_path := har_queue.get()) is not None:
+        analyze_and_append(har_path, write_lock, crawl_data_dir)
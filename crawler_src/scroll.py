@@ -0,0 +1,136 @@
+from time import time
+
+from playwright.sync_api import Error as PlaywrightError, Page
+
+
+# The whole scroll loop runs inside the page, so a site costs a single `page.evaluate` round trip
+# instead of three evaluates and a Python sleep per step. Lazy-loaded content is detected through
+# the page height growing and through new entries showing up in the resource timing buffer.
+SCROLL_SCRIPT = '''
+async ({stepPx, stepJitterPx, minPauseMs, maxPauseMs, maxSteps, maxDurationMs, maxHeightPx, lazyLoadIdleMs, lazyLoadTimeoutMs}) => {
+    const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+    const now = () => performance.now();
+    const pageHeight = () => Math.max(
+        document.body ? document.body.scrollHeight : 0,
+        document.documentElement ? document.documentElement.scrollHeight : 0
+    );
+    const started = now();
+    const deadline = started + maxDurationMs;
+
+    let lastResourceAt = now();
+    let resourcesLoaded = 0;
+    let observer = null;
+    if (typeof PerformanceObserver !== 'undefined') {
+        observer = new PerformanceObserver((list) => {
+            resourcesLoaded += list.getEntries().length;
+            lastResourceAt = now();
+        });
+        try {
+            observer.observe({type: 'resource', buffered: false});
+        } catch (e) {
+            observer = null;
+        }
+    }
+
+    // Wait until no new resource has finished for `lazyLoadIdleMs`, bounded by the timeout and the deadline
+    const waitForLazyLoad = async () => {
+        const waitStarted = now();
+        const waitUntil = Math.min(waitStarted + lazyLoadTimeoutMs, deadline);
+        while (now() < waitUntil && now() - Math.max(lastResourceAt, waitStarted) < lazyLoadIdleMs) {
+            await sleep(50);
+        }
+    };
+
+    let steps = 0;
+    let lazyLoads = 0;
+    let stopReason = 'bottom';
+    let height = pageHeight();
+    const initialHeight = height;
+
+    while (true) {
+        if (steps >= maxSteps) { stopReason = 'max_steps'; break; }
+        if (now() >= deadline) { stopReason = 'max_duration'; break; }
+        if (window.scrollY + window.innerHeight >= maxHeightPx) { stopReason = 'max_height'; break; }
+
+        // Using a trackpad, a single swipe scrolls about `stepPx` pixels
+        const jitter = Math.floor(Math.random() * 2 * stepJitterPx) - stepJitterPx;
+        const previousY = window.scrollY;
+        window.scrollBy(0, stepPx + jitter);
+        steps += 1;
+        await sleep(minPauseMs + Math.random() * (maxPauseMs - minPauseMs));
+
+        const newHeight = pageHeight();
+        if (newHeight > height) {
+            lazyLoads += 1;
+            height = newHeight;
+            await waitForLazyLoad();
+            // there is new content below, even if this step did not move the page
+            continue;
+        }
+
+        if (window.scrollY === previousY) {
+            // We might be waiting on an infinite scroll loader, so give it one chance to extend the page
+            await waitForLazyLoad();
+            const settledHeight = pageHeight();
+            if (settledHeight <= height) break;
+            lazyLoads += 1;
+            height = settledHeight;
+        }
+    }
+
+    if (observer !== null) observer.disconnect();
+
+    return {
+        steps: steps,
+        stop_reason: stopReason,
+        duration_ms: Math.round(now() - started),
+        final_scroll_y: Math.round(window.scrollY),
+        initial_height: initialHeight,
+        final_height: pageHeight(),
+        lazy_loads: lazyLoads,
+        resources_loaded: resourcesLoaded
+    };
+}
+'''
+
+DEFAULT_SCROLL_OPTIONS = {
+    'stepPx': 1200,
+    'stepJitterPx': 100,
+    'minPauseMs': 500,
+    'maxPauseMs': 1500,
+    'maxSteps': 50,
+    'maxDurationMs': 30000,
+    'maxHeightPx': 60000,
+    'lazyLoadIdleMs': 500,
+    'lazyLoadTimeoutMs': 3000,
+}
+
+
+def scroll_page(page: Page, **options) -> dict:
+    """
+    Scrolls the page to the bottom in humanlike, jittered steps using a single in-page evaluate call.
+    The scroll stops at the bottom of the page or when one of the step, duration or height caps is hit,
+    so infinite-scroll pages are bounded as well. Returns a report of the scroll.
+    If the page navigates while scrolling (e.g. a consent banner reloads it), the in-page loop is lost
+    and only a partial report with stop reason 'navigated' is returned.
+    """
+    unknown_options = set(options) - set(DEFAULT_SCROLL_OPTIONS)
+    if unknown_options:
+        raise ValueError(f'unknown scroll options: {sorted(unknown_options)}')
+
+    scroll_options = {**DEFAULT_SCROLL_OPTIONS, **options}
+    started = time()
+    try:
+        return page.evaluate(SCROLL_SCRIPT, scroll_options)
+    except PlaywrightError as e:
+        print(f'Scrolling was interrupted: {e.message}')
+        return {
+            'steps': None,
+            'stop_reason': 'navigated',
+            'duration_ms': round((time() - started) * 1000),
+            'final_scroll_y': None,
+            'initial_height': None,
+            'final_height': None,
+            'lazy_loads': None,
+            'resources_loaded': None
+        }
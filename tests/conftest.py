@@ -0,0 +1,8 @@
+import os
+import sys
+
+
+# the crawler and the analysis are run as scripts, so their modules import each other as top-level modules
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'crawler_src'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'analysis'))
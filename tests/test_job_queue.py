@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(job_queue, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'queue.db')
+
+
+def test_lease_hands_out_sites_in_order_and_only_once(queue_path, clock):
+    queue = JobQueue(queue_path)
+    assert queue.add(['a', 'b']) == 2
+    assert queue.add(['b', 'c']) == 1
+
+    assert [queue.lease('w1'), queue.lease('w2'), queue.lease('w1')] == ['a', 'b', 'c']
+    assert queue.lease('w2') is None
+    assert queue.counts() == {'leased': 3}
+
+
+def test_expired_lease_is_handed_out_again(queue_path, clock):
+    queue = JobQueue(queue_path, lease_seconds=10, max_attempts=3)
+    queue.add(['a'])
+    assert queue.lease('crashed') == 'a'
+
+    clock[0] += 11
+    assert queue.lease('w2') == 'a'
+    # the worker whose lease expired can no longer report on the site
+    assert not queue.complete('a', 'crashed', {'ok': True})
+    assert not queue.heartbeat('a', 'crashed')
+    assert queue.complete('a', 'w2', {'ok': True})
+    assert queue.results() == {'a': {'ok': True}}
+
+
+def test_heartbeat_keeps_the_lease(queue_path, clock):
+    queue = JobQueue(queue_path, lease_seconds=10)
+    queue.add(['a'])
+    queue.lease('w1')
+
+    for _ in range(3):
+        clock[0] += 8
+        assert queue.heartbeat('a', 'w1')
+    assert queue.lease('w2') is None
+    assert queue.complete('a', 'w1', {})
+
+
+def test_site_fails_after_max_attempts(queue_path, clock):
+    queue = JobQueue(queue_path, lease_seconds=10, max_attempts=2)
+    queue.add(['a'])
+
+    queue.lease('w1')
+    assert queue.fail('a', 'w1', 'boom')
+    assert queue.counts() == {'pending': 1}
+
+    # the second attempt expires instead of failing
+    queue.lease('w1')
+    clock[0] += 11
+    assert queue.lease('w2') is None
+    assert queue.counts() == {'failed': 1}
+    assert queue.failed() == ['a']
+    assert queue.results() == {}
+
+
+def test_is_drained_waits_for_leased_sites(queue_path, clock):
+    queue = JobQueue(queue_path, lease_seconds=10)
+    queue.add(['a'])
+    queue.lease('w1')
+
+    assert queue.lease('w2') is None
+    assert not queue.is_drained()
+    queue.complete('a', 'w1', {})
+    assert queue.is_drained()
+
+
+def test_report_is_claimed_once_and_again_after_adding_sites(queue_path, clock):
+    queue = JobQueue(queue_path)
+    queue.add(['a'])
+    assert not queue.claim_report('w1')
+
+    queue.complete(queue.lease('w1'), 'w1', {})
+    assert queue.claim_report('w2')
+    assert not queue.claim_report('w1')
+
+    queue.add(['b'])
+    queue.complete(queue.lease('w1'), 'w1', {})
+    assert queue.claim_report('w1')
+
+
+def test_queue_rejects_another_crawl_mode(queue_path):
+    JobQueue(queue_path, mode='allow').close()
+    JobQueue(queue_path, mode='allow').close()
+    with pytest.raises(ValueError):
+        JobQueue(queue_path, mode='block')
+
+
+def _crawl(queue_path: str, worker: str, crash: bool) -> None:
+    queue = JobQueue(queue_path, lease_seconds=0.5)
+    while True:
+        url = queue.lease(worker)
+        if url is None:
+            if queue.is_drained():
+                break
+            continue
+        if crash:
+            # die while holding the lease, without reporting anything
+            os._exit(1)
+        queue.complete(url, worker, {'worker': worker})
+    queue.claim_report(worker)
+
+
+def test_sites_of_a_crashed_worker_are_crawled_by_the_others(queue_path):
+    queue = JobQueue(queue_path)
+    queue.add([f'site{i}' for i in range(10)])
+
+    crashing = multiprocessing.Process(target=_crawl, args=(queue_path, 'crashing', True))
+    crashing.start()
+    crashing.join()
+    workers = [multiprocessing.Process(target=_crawl, args=(queue_path, f'w{i}', False)) for i in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    assert queue.counts() == {'done': 10}
+    assert 'crashing' not in {result['worker'] for result in queue.results().values()}
+    assert not queue.claim_report('late')
@@ -0,0 +1,81 @@
+import pytest
+
+import timing_attribution
+from timing_attribution import FIRST_PARTY, attribute_intervals, attribute_page_load_time, compare_attributions
+
+
+@pytest.fixture(autouse=True)
+def no_domain_map(monkeypatch):
+    monkeypatch.setattr(timing_attribution, 'get_domain_map', lambda: {})
+
+
+def interval(start, end, group, phases=None):
+    return {'start': start, 'end': end, 'phases': phases or {}, 'group': group}
+
+
+def entry(url, started, time, timings=None, pageref='page_1'):
+    return {
+        'pageref': pageref,
+        'startedDateTime': f'2024-01-01T00:00:{started:06.3f}Z',
+        'time': time,
+        'timings': timings or {},
+        'request': {'url': url}
+    }
+
+
+def har(on_load, entries):
+    return {'log': {
+        'pages': [{'id': 'page_1', 'startedDateTime': '2024-01-01T00:00:00.000Z', 'pageTimings': {'onLoad': on_load}}],
+        'entries': entries
+    }}
+
+
+def test_overlapping_intervals_are_split_between_groups():
+    groups = attribute_intervals([interval(0, 10, 'a'), interval(5, 15, 'b'), interval(5, 8, 'a')], 'group')
+
+    assert groups['a'] == {'requests': 2, 'busy_ms': 10, 'exclusive_ms': 5, 'share_ms': 7.5, 'phases': {}}
+    assert groups['b'] == {'requests': 1, 'busy_ms': 10, 'exclusive_ms': 5, 'share_ms': 7.5, 'phases': {}}
+    # the shares add up to the time any request was in flight
+    assert sum(group['share_ms'] for group in groups.values()) == 15
+
+
+def test_touching_intervals_do_not_overlap():
+    groups = attribute_intervals([interval(0, 5, 'a'), interval(5, 10, 'a'), interval(5, 10, 'b')], 'group')
+
+    assert groups['a']['busy_ms'] == 10
+    assert groups['a']['exclusive_ms'] == 5
+    assert groups['a']['share_ms'] == 7.5
+    assert groups['b']['share_ms'] == 2.5
+
+
+def test_entries_and_their_phases_are_clipped_to_on_load():
+    timings = {'blocked': -1, 'dns': 10, 'connect': 20, 'ssl': -1, 'send': 0, 'wait': 30, 'receive': 40}
+    attribution = attribute_page_load_time(har(50, [
+        entry('https://example.com/', 0, 100, timings),
+        entry('https://tracker.net/t.js', 0.040, 20)
+    ]), {'tracker.net': 'Advertising'})
+
+    assert len(attribution) == 1
+    first_party = attribution[0]['parties']['first']
+    assert first_party['busy_ms'] == 50
+    # only dns, connect and the first 20 ms of wait happened before onLoad
+    assert first_party['phases'] == {'dns': 10, 'connect': 20, 'wait': 20}
+    assert attribution[0]['categories']['Advertising']['busy_ms'] == pytest.approx(10)
+    assert attribution[0]['categories'][FIRST_PARTY]['share_ms'] == pytest.approx(45)
+
+
+@pytest.mark.parametrize('on_load', [None, -1])
+def test_pages_without_on_load_are_skipped(on_load):
+    assert attribute_page_load_time(har(on_load, [entry('https://example.com/', 0, 100)]), {}) == []
+
+
+def test_har_without_pages_has_no_attribution():
+    assert attribute_page_load_time({'log': {'entries': [entry('https://example.com/', 0, 100)]}}, {}) == []
+
+
+def test_sites_that_did_not_load_in_one_crawl_are_not_compared():
+    attribution = attribute_page_load_time(har(50, [entry('https://example.com/', 0, 50)]), {})
+
+    assert compare_attributions(attribution, []) is None
+    assert compare_attributions([], attribution) is None
+    assert compare_attributions(attribution, attribution) == {'on_load_allow': 50, 'on_load_block': 50, 'saved_ms': 0, 'tracker_share_ms': 0}